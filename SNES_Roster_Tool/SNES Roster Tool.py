@@ -13,16 +13,165 @@
 
 from tkinter import Tk, Menu, PhotoImage, BOTH
 from tkinter.ttk import Frame, Button, Label
-from tkinter.filedialog import askopenfilename
+from tkinter.filedialog import askopenfilename, askopenfilenames, askdirectory
 from tkinter.filedialog import asksaveasfilename
 from tkinter.messagebox import showinfo, showerror
 
 import sys
 from binascii import b2a_hex
+from concurrent.futures import ThreadPoolExecutor
 import csv
+import json
 import os
 import shutil
 import struct
+import tempfile
+import zlib
+
+# Roster Snapshot format - all values are little endian
+# Header: "N94R", Version (2 bytes), Number of Teams (2 bytes), Checksum (4 bytes, CRC32 of the file without the
+# Checksum itself)
+# Team Index, one entry per team: Team Record Offset (4 bytes), Team Hash (4 bytes), Player Data Space (2 bytes),
+# Player Data Offset (2 bytes), Player Data Size (2 bytes), # of G, F and D (1 byte each), Unused (1 byte)
+# Team Record: AA TEAM CITY BB TEAM ABV CC TEAM NICKNAME, then the Player Data as stored in the ROM
+# AA, BB, CC - Length of the name that follows
+# The fixed size Team Index lets a team be found without reading the others, so the format can be memory-mapped.
+# Snapshots are small though, so the tool reads the whole file and checks the Checksum on every load.
+
+SNAP_MAGIC = b'N94R'
+SNAP_VERSION = 1
+SNAP_HEAD = struct.Struct('<4sHHI')
+SNAP_TEAM = struct.Struct('<IIHHH3Bx')
+
+
+class RomData:
+    # Parse context for one ROM, holding the whole ROM file in a buffer
+    # The header offset and pointer base are set once when the ROM is loaded, and every read is made at an absolute
+    # position instead of through a shared file position.  Nothing is changed by a read, so several ROMs can be
+    # parsed at the same time from different threads.
+
+    def __init__(self, data):
+
+        # Pass a bytearray if changes will be written to the ROM
+        self.data = data
+
+        self.head_offset = self.checkhead()
+
+        # Team Pointers are relative to 0x0D8000 - Headerless, 0x0D8200 Headered
+        self.ptr_base = 0x0D8000 + self.head_offset
+
+    def checkhead(self):
+
+        # Checks for SMC header and returns offset
+        # Checks for ROM Name in ROM Header at 32704 (7FC0) - NHL '94 (4E 48 4C 20 27 39 34)
+        # Header is size 512 bytes (200 hex)
+
+        if self.data[32704:32711] == b"NHL '94":
+            return 0
+        else:
+            return 512
+
+    def check(self, pos, size):
+        # Make sure a read or write is inside the ROM
+
+        if pos < 0 or size < 0 or pos + size > len(self.data):
+            raise ValueError("Position " + str(pos) + " is outside of the ROM")
+
+    def read(self, pos, size):
+        self.check(pos, size)
+        return bytes(self.data[pos:pos + size])
+
+    def read_byte(self, pos):
+        self.check(pos, 1)
+        return self.data[pos]
+
+    def read_word(self, pos):
+        # Little endian 2 byte value
+        self.check(pos, 2)
+        return struct.unpack_from('<H', self.data, pos)[0]
+
+    def write(self, pos, data):
+        self.check(pos, len(data))
+        self.data[pos:pos + len(data)] = data
+
+    def tm_ptrs(self):
+        # Retrieve Team Offset Pointers
+
+        # Team Offset Start Position - 927207 - Headerless, 927719 Headered
+        # Each pointer is 2 bytes, followed by 2 unused bytes
+        start = 927207 + self.head_offset
+
+        return [self.read_word(start + i * 4) + self.ptr_base for i in range(0, 28)]
+
+    def get_team_info(self, ptr):
+        # Retrieve Team Info
+
+        # Team Name Data starts at the end of Player Data (offset given at bytes 4 and 5 in Team Data)
+        # First offset: Length of Team City (including this byte)
+        # AA 00 TEAM CITY BB 00 TEAM ABV CC 00 TEAM NICKNAME DD 00 TEAM ARENA
+        # AA - Length of Team City (includes AA and 00)
+        # BB - Length of Team Abv (includes BB and 00)
+        # CC - Length of Team Nickname (includes CC and 00)
+        # DD - Length of Team Arena (includes DD and 00)
+        # All Name Data is in ASCII format.
+
+        # Player Data Offset - Default is 55 00 (85 bytes), but in some custom ROMs, may be different
+        ploff = self.read_word(ptr)
+
+        # Team Data Offset - Team Offset + 4 bytes
+        tmpos = self.read_word(ptr + 4)
+        dataoff = ptr + tmpos
+
+        # Calculate Player Data Space
+        # Team Data Offset - Player Data Offset - 2 (last 2 bytes of Player Data 02 00)
+        plsize = tmpos - ploff - 2
+
+        # Read Team City, Abv and Nickname
+        names = []
+        for i in range(0, 3):
+            tml = self.read_byte(dataoff)
+            names.append(self.read(dataoff + 2, tml - 2).decode("utf-8"))
+            dataoff += tml
+
+        return dict(city=names[0], abv=names[1], name=names[2], plspace=plsize, ploff=ploff)
+
+    def get_counts(self, ptr):
+        # Calculate # of Players - Goalies First, then F and D
+        # Goalies are flagged by nibbles at bytes 19 and 20, F and D share byte 17 (F high nibble, D low nibble)
+
+        gdata = b2a_hex(self.read(ptr + 19, 2)).decode("utf-8")
+        numg = gdata.find("0")
+        if numg == -1:  # All 4 Goalie nibbles are set
+            numg = 4
+
+        pdata = self.read_byte(ptr + 17)
+        numf = pdata >> 4
+        numd = pdata & 15
+
+        return numg, numf, numd
+
+    def get_team_block(self, ptr, tminfo):
+        # Retrieve the raw Player Data for a team, without decoding it
+        # Each Player is Name Length + 8 bytes (JNo and 7 Attribute bytes), so the end of the roster list can be
+        # found by walking the Name Length bytes
+
+        numg, numf, numd = self.get_counts(ptr)
+
+        start = ptr + tminfo['ploff']
+        end = start
+        for i in range(0, numg + numf + numd):
+            end += self.read_byte(end) + 8
+
+        return self.read(start, end - start)
+
+    def read_teams(self):
+        # Retrieve Team Info, # of G, F and D and raw Player Data for every team in the ROM
+
+        teams = []
+        for ptr in self.tm_ptrs():
+            tminfo = self.get_team_info(ptr)
+            teams.append((tminfo, self.get_counts(ptr), self.get_team_block(ptr, tminfo)))
+        return teams
 
 
 class RosExt(Frame):
@@ -33,7 +182,6 @@ class RosExt(Frame):
 
         # Instance Variables
         self.bg_image = ""
-        self.head_offset = 0  # Header Offset
 
         self.initUI()
 
@@ -51,12 +199,23 @@ class RosExt(Frame):
         fileMenu = Menu(menubar, tearoff=0)
         fileMenu.add_command(label="Import ROM to CSV...", command=self.importcsv)
         fileMenu.add_command(label="Export ROM to CSV...", command=self.extractrom)
+        fileMenu.add_command(label="Export Multiple ROMs to CSV...", command=self.extractmany)
+        fileMenu.add_command(label="Compare Rosters...", command=self.comparerosters)
         fileMenu.add_command(label="Exit", command=self.quit)
         menubar.add_cascade(label="File", menu=fileMenu)
 
+        snapMenu = Menu(menubar, tearoff=0)
+        snapMenu.add_command(label="Create Snapshot from ROM...", command=self.romsnapshot)
+        snapMenu.add_command(label="Create Snapshot from CSV...", command=self.csvsnapshot)
+        snapMenu.add_command(label="Export Snapshot to CSV...", command=self.snapshotcsv)
+        snapMenu.add_command(label="Import Snapshot to ROM...", command=self.snapshotrom)
+        menubar.add_cascade(label="Snapshot", menu=snapMenu)
+
         helpMenu = Menu(menubar, tearoff=0)
         helpMenu.add_command(label="Export to CSV Instructions...", command=self.expinst)
         helpMenu.add_command(label="Import from CSV Instructions...", command=self.impinst)
+        helpMenu.add_command(label="Compare Rosters Instructions...", command=self.diffinst)
+        helpMenu.add_command(label="Roster Snapshot Instructions...", command=self.snapinst)
 
         helpMenu.add_command(label="About...", command=self.about)
         menubar.add_cascade(label="Help", menu=helpMenu)
@@ -96,7 +255,9 @@ class RosExt(Frame):
                  "Handedness is an odd number for R, even number for L\n\n"
                  "The program will ask you to choose the NHL '94 ROM file to extract the roster data from.  Please "
                  "choose the ROM file, then it will ask you to choose a filename to save the data to in CSV format."
-                 "  The program will tell you if it completed successfully, or if there was an error.")
+                 "  The program will tell you if it completed successfully, or if there was an error.\n\n"
+                 "To export several ROMs at once, use 'Export Multiple ROMs to CSV' and choose the ROM files, then the "
+                 "folder to save the CSV files to.  Each CSV file is named after its ROM.")
 
     def impinst(self):
 
@@ -113,6 +274,9 @@ class RosExt(Frame):
                  "If you use column labels, the data can be in any order, but if you choose not use column labels, the "
                  "data needs to be stored in the above order.\n\nYou can use the CSV file output from 'Export to CSV' "
                  "as a template.\n\n"
+                 "The rows can be sorted in any order.  Players are grouped by team, and each team's roster is "
+                 "saved with the Goalies first, then the Forwards and Defenders, keeping the order of the rows within "
+                 "each position.\n\n"
                  "The program will ask for the CSV file to import, then will ask you for the ROM file you wish to "
                  "import to.  It will then ask you to choose a name and location to save the modified ROM.  It will "
                  "make a copy of the ROM file, import the rosters, and save the modified copy to the named location.  "
@@ -122,28 +286,38 @@ class RosExt(Frame):
                  "program will notify you when there is no more space in the ROM for that team.\n\nThe ROM file created"
                  " with this program is compatible with the SNES Editor created by Statto.")
 
-    def about(self):
+    def diffinst(self):
 
-        showinfo("About SNES Roster Tool", "SNES Roster Tool Version 0.7\n\nCreated by chaos\n\nIf there are any bugs "
-                                           "or questions, please email me at chaos@nhl94.com")
-
-    def checkhead(self, f):
-
-        # Checks for SMC header and creates offset if needed
-        # Checks for ROM Name in ROM Header at 32704 (7FC0) - NHL '94 (4E 48 4C 20 27 39 34)
-        # Header is size 512 bytes (200 hex)
-
-        f.seek(32704)
-        name = b2a_hex(f.read(7)).decode("utf-8")
+        showinfo("SNES Roster Tool Instructions",
+                 "The Roster tool allows you to compare the rosters of any two NHL '94 ROMs, CSV files or roster "
+                 "snapshots.\n\n"
+                 "The program will ask you to choose the original file, then the file to compare it to.  It will then "
+                 "ask you to choose a name and location to save the comparison report.  Save the report with a .json "
+                 "extension to get JSON output, otherwise it will be saved as text.\n\n"
+                 "Teams that are identical in both files are skipped.  For the teams that have changed, the report "
+                 "lists the players that were added, removed, or moved to another team, and any changes to a "
+                 "player's position, jersey number or attributes.  It also notes when a team's roster order has "
+                 "changed, as the default lines follow the roster order.\n\n"
+                 "CSV files need to be in the same format used by 'Import from CSV'.")
+
+    def snapinst(self):
 
-        print(name)
+        showinfo("SNES Roster Tool Instructions",
+                 "A roster snapshot is a small file that stores a ROM's teams and players.  Snapshots take a fraction "
+                 "of the space of a CSV file and load quickly, which makes them useful for keeping a copy of every "
+                 "roster you release.\n\n"
+                 "Create Snapshot from ROM - choose a ROM, then a name and location for the snapshot.\n\n"
+                 "Create Snapshot from CSV - choose a CSV file and the ROM it is meant for, then a name and location "
+                 "for the snapshot.  The CSV file is checked the same way as 'Import from CSV'.\n\n"
+                 "Export Snapshot to CSV - choose a snapshot, then a name and location for the CSV file.\n\n"
+                 "Import Snapshot to ROM - choose a snapshot and a ROM, then a name and location for the new ROM.  "
+                 "The player data space limits are the same as 'Import from CSV'.\n\n"
+                 "Snapshots can also be used with 'Compare Rosters'.")
 
-        if name == "4e484c20273934":
-            self.head_offset = 0
-        else:
-            self.head_offset = 512
+    def about(self):
 
-        print(self.head_offset)
+        showinfo("About SNES Roster Tool", "SNES Roster Tool Version 0.7\n\nCreated by chaos\n\nIf there are any bugs "
+                                           "or questions, please email me at chaos@nhl94.com")
 
     def importcsv(self):
 
@@ -156,24 +330,17 @@ class RosExt(Frame):
                 rom = askopenfilename(title="Choose a '94 ROM file...", filetypes=romtypes, initialdir=home)
                 save = asksaveasfilename(title="Enter a name for the new '94 ROM file...",
                                          defaultextension='.smc', initialdir=home)
-                shutil.copyfile(rom, save)
-
-                with open(save, 'rb+') as f:
-                    success = self.importroster(csvfile, f)
-                    f.close()
-                    if success == 0:
-                        showinfo("SNES NHL '94 Roster Tool", "Roster Data has been imported successfully.")
-                    elif success == 1:
-                        showerror("SNES NHL '94 Roster Tool", "There is an error.")
-                    elif success == 2:
-                        showerror("SNES NHL '94 Roster Tool", "The CSV file is missing fields or some fields are "
-                                                              "blank.  Please check the file.")
-                    elif success == 3:
-                        showerror("SNES NHL '94 Roster Tool", "The CSV file has a team listed that cannot be found in "
-                                                              "the ROM.  Please check the file.")
-                    elif success == 4:
-                        showerror("SNES NHL '94 Roster Tool", "Please make the necessary changes to the CSV file and "
-                                                              "try again.")
+
+                # The import is done on a copy of the ROM in memory, and only written out if it succeeds
+                with open(rom, 'rb') as r:
+                    romdata = RomData(bytearray(r.read()))
+
+                success = self.importroster(csvfile, romdata)
+                if success == 0:
+                    self.write_file(rom, save, romdata.data)
+                    showinfo("SNES NHL '94 Roster Tool", "Roster Data has been imported successfully.")
+                else:
+                    self.import_error(success)
 
             except IOError:
                 showerror("SNES NHL '94 Roster Tool", "Could not open ROM or CSV file.  Please check file "
@@ -183,6 +350,34 @@ class RosExt(Frame):
                           "There was an error in accessing or modifying roster info.  Please make sure that "
                           "you are using a valid NHL '94 ROM and the CSV file is formatted correctly.")
 
+    def import_error(self, success):
+
+        if success == 1:
+            showerror("SNES NHL '94 Roster Tool", "There is an error.")
+        elif success == 2:
+            showerror("SNES NHL '94 Roster Tool", "The CSV file is missing fields or some fields are "
+                                                  "blank.  Please check the file.")
+        elif success == 3:
+            showerror("SNES NHL '94 Roster Tool", "The CSV file has a team listed that cannot be found in "
+                                                  "the ROM.  Please check the file.")
+        elif success == 4:
+            showerror("SNES NHL '94 Roster Tool", "Please make the necessary changes to the CSV file and "
+                                                  "try again.")
+
+    def write_file(self, src, save, data):
+        # Write a new ROM or snapshot to a temporary file next to the save location, then move it into place
+        # The save location is never left with a partly written file.  Permissions are copied from the source file
+
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(os.path.abspath(save)))
+        try:
+            with os.fdopen(fd, 'wb') as t:
+                t.write(data)
+            shutil.copymode(src, tmp)
+            os.replace(tmp, save)
+        except OSError:
+            os.remove(tmp)
+            raise
+
     def extractrom(self):
 
         ftypes = [("'94 ROM Files", '*.smc')]
@@ -190,13 +385,13 @@ class RosExt(Frame):
         file = askopenfilename(title="Please choose a '94 ROM file...", filetypes=ftypes, initialdir=home)
         if file != '':
             try:
-                f = open(file, 'rb')
+                with open(file, 'rb') as f:
+                    rom = RomData(f.read())
                 save = asksaveasfilename(title="Please choose a name and location for the CSV file...",
                                          defaultextension='.csv', initialdir=home)
                 with open(save, 'w', newline='') as w:
-                    self.extractroster(f, w)
-                    f.close()
-                    w.close()
+                    self.extractroster(rom, w)
+                showinfo("SNES NHL '94 Roster Tool", "Roster Data has been extracted.")
             except IOError:
                 showerror("SNES NHL '94 Roster Tool", "Could not open ROM or create CSV file.  Please check file "
                                                       "permissions.")
@@ -205,157 +400,242 @@ class RosExt(Frame):
                           "There was an error in retreiving roster info.  Please make sure that "
                           "you are using a valid NHL '94 ROM.")
 
-    def importroster(self, file, f):
-        # Import roster data from CSV into ROM
+    def extractmany(self):
 
-        fields = ['First', 'Last', 'Abv', 'Pos', 'JNo', 'Ovr', 'Wgt', 'Agl', 'Spd', 'OfA', 'DfA', 'ShP-PkC', 'Chk',
-                  'Hnd', 'StH', 'ShA', 'End-StR', 'Rgh-StL', 'Pas-GlR', 'Agr-GlL']
-        tminfo = {}
-        tmdata = {}
+        ftypes = [("'94 ROM Files", '*.smc')]
+        home = os.path.expanduser('~')
+        files = askopenfilenames(title="Please choose the '94 ROM files...", filetypes=ftypes, initialdir=home)
+        if files:
+            outdir = askdirectory(title="Please choose a folder for the CSV files...", initialdir=home)
+            if outdir != '':
+                # Each ROM has its own RomData, so they can all be extracted at the same time
+                with ThreadPoolExecutor() as pool:
+                    results = list(pool.map(lambda file: self.extract_file(file, outdir), files))
+
+                failed = [os.path.basename(file) for file, ok in zip(files, results) if not ok]
+                if failed:
+                    showerror("SNES NHL '94 Roster Tool", "Roster Data could not be extracted from: " +
+                              ', '.join(failed) + ".  Please make sure that you are using valid NHL '94 ROMs and "
+                                                  "check file permissions.")
+                else:
+                    showinfo("SNES NHL '94 Roster Tool", "Roster Data has been extracted from " + str(len(files)) +
+                             " ROM(s).")
+
+    def extract_file(self, file, outdir):
+        # Extract one ROM to a CSV file of the same name in outdir
+        # Returns False if the ROM could not be read or the CSV file created
+
+        save = os.path.join(outdir, os.path.splitext(os.path.basename(file))[0] + '.csv')
+        try:
+            with open(file, 'rb') as f:
+                rom = RomData(f.read())
+            with open(save, 'w', newline='') as w:
+                self.extractroster(rom, w)
+        except (IOError, ValueError):
+            return False
+        return True
+
+    def comparerosters(self):
+
+        ftypes = [("'94 ROM Files", '*.smc'), ("'CSV Files", '*.csv'), ("Roster Snapshots", '*.n94')]
+        reptypes = [("Text Files", '*.txt'), ("JSON Files", '*.json')]
+        home = os.path.expanduser('~')
+        first = askopenfilename(title="Choose the original ROM, CSV or snapshot file...", filetypes=ftypes,
+                                initialdir=home)
+        if first != '':
+            try:
+                second = askopenfilename(title="Choose the ROM, CSV or snapshot file to compare to...",
+                                         filetypes=ftypes, initialdir=home)
+                save = asksaveasfilename(title="Please choose a name and location for the comparison report...",
+                                         filetypes=reptypes, defaultextension='.txt', initialdir=home)
+
+                old = self.load_source(first)
+                new = self.load_source(second)
+                if old is None or new is None:
+                    return
+
+                diff = self.diff_rosters(old, new)
+                with open(save, 'w') as w:
+                    if save.lower().endswith('.json'):
+                        json.dump(diff, w, indent=2)
+                    else:
+                        w.write(self.format_diff(diff))
+
+                showinfo("SNES NHL '94 Roster Tool", "Rosters have been compared.  " + str(len(diff['teams'])) +
+                         " team(s) have changed.")
 
-        # CSV open
+            except IOError:
+                showerror("SNES NHL '94 Roster Tool", "Could not open ROM, CSV or snapshot file, or create the "
+                                                      "report.  Please check file permissions.")
+            except ValueError:
+                showerror("SNES NHL '94 Roster Tool",
+                          "There was an error in retreiving roster info.  Please make sure that "
+                          "you are using a valid NHL '94 ROM and the CSV file is formatted correctly.")
 
-        csvfile = open(file, 'r', newline='')
+    def romsnapshot(self):
 
-        # Check for Header Rows
+        romtypes = [("'94 ROM Files", '*.smc')]
+        home = os.path.expanduser('~')
+        rom = askopenfilename(title="Choose a '94 ROM file...", filetypes=romtypes, initialdir=home)
+        if rom != '':
+            try:
+                save = asksaveasfilename(title="Please choose a name and location for the snapshot...",
+                                         defaultextension='.n94', initialdir=home)
+                with open(rom, 'rb') as r:
+                    data = self.make_snapshot(RomData(r.read()))
+                self.write_file(rom, save, data)
+                showinfo("SNES NHL '94 Roster Tool", "Roster Snapshot has been created.")
 
-        header = csv.Sniffer().has_header(csvfile.read(1024))
-        csvfile.seek(0)
+            except IOError:
+                showerror("SNES NHL '94 Roster Tool", "Could not open ROM or create snapshot file.  Please check "
+                                                      "file permissions.")
+            except ValueError:
+                showerror("SNES NHL '94 Roster Tool",
+                          "There was an error in retreiving roster info.  Please make sure that "
+                          "you are using a valid NHL '94 ROM.")
 
-        if header:
-            reader = csv.DictReader(csvfile)
-            chk = set(fields) & set(reader.fieldnames)
-            if len(chk) != 20:
-                showerror("SNES '94 Roster Tool",
-                          "The column field names are incorrect.  They should be: " + ', '.join(fields))
-                csvfile.close()
-                return 4
+    def csvsnapshot(self):
 
-        else:
-            reader = csv.DictReader(csvfile, fieldnames=fields)
+        ftypes = [("'CSV Files", '*.csv')]
+        romtypes = [("'94 ROM Files", '*.smc')]
+        home = os.path.expanduser('~')
+        csvfile = askopenfilename(title="Choose a CSV file...", filetypes=ftypes, initialdir=home)
+        if csvfile != '':
+            try:
+                rom = askopenfilename(title="Choose the '94 ROM file for this roster...", filetypes=romtypes,
+                                      initialdir=home)
+                save = asksaveasfilename(title="Please choose a name and location for the snapshot...",
+                                         defaultextension='.n94', initialdir=home)
+
+                # The CSV is imported into a copy of the ROM in memory, which is then used for the snapshot
+                with open(rom, 'rb') as r:
+                    romdata = RomData(bytearray(r.read()))
+
+                success = self.importroster(csvfile, romdata)
+                if success == 0:
+                    self.write_file(csvfile, save, self.make_snapshot(romdata))
+                    showinfo("SNES NHL '94 Roster Tool", "Roster Snapshot has been created.")
+                else:
+                    self.import_error(success)
 
-        check = self.check_csv(reader)
-        if not check:
-            csvfile.close()
-            return 2
+            except IOError:
+                showerror("SNES NHL '94 Roster Tool", "Could not open ROM or CSV file.  Please check file "
+                                                      "permissions.")
+            except ValueError:
+                showerror("SNES NHL '94 Roster Tool",
+                          "There was an error in accessing roster info.  Please make sure that "
+                          "you are using a valid NHL '94 ROM and the CSV file is formatted correctly.")
 
-        # If Header row, it must be skipped
+    def snapshotcsv(self):
 
-        if header:
-            csvfile.seek(0)
-            next(csvfile)
-        else:
-            csvfile.seek(0)
+        snaptypes = [("Roster Snapshots", '*.n94')]
+        home = os.path.expanduser('~')
+        snap = askopenfilename(title="Choose a roster snapshot...", filetypes=snaptypes, initialdir=home)
+        if snap != '':
+            try:
+                save = asksaveasfilename(title="Please choose a name and location for the CSV file...",
+                                         defaultextension='.csv', initialdir=home)
+                teams = self.load_snapshot(snap)
+                with open(save, 'w', newline='') as w:
+                    self.snapshot_to_csv(teams, w)
+                showinfo("SNES NHL '94 Roster Tool", "Roster Data has been extracted.")
+
+            except IOError:
+                showerror("SNES NHL '94 Roster Tool", "Could not open snapshot or create CSV file.  Please check "
+                                                      "file permissions.")
+            except ValueError:
+                showerror("SNES NHL '94 Roster Tool",
+                          "There was an error in retreiving roster info.  Please make sure that "
+                          "you are using a valid roster snapshot.")
+
+    def snapshotrom(self):
+
+        snaptypes = [("Roster Snapshots", '*.n94')]
+        romtypes = [("'94 ROM Files", '*.smc')]
+        home = os.path.expanduser('~')
+        snap = askopenfilename(title="Choose a roster snapshot...", filetypes=snaptypes, initialdir=home)
+        if snap != '':
+            try:
+                rom = askopenfilename(title="Choose a '94 ROM file...", filetypes=romtypes, initialdir=home)
+                save = asksaveasfilename(title="Enter a name for the new '94 ROM file...",
+                                         defaultextension='.smc', initialdir=home)
+
+                teams = self.load_snapshot(snap)
+                with open(rom, 'rb') as r:
+                    romdata = RomData(bytearray(r.read()))
+
+                success = self.import_rows(self.snapshot_rows(teams), romdata)
+                if success == 0:
+                    self.write_file(rom, save, romdata.data)
+                    showinfo("SNES NHL '94 Roster Tool", "Roster Data has been imported successfully.")
+                else:
+                    self.import_error(success)
+
+            except IOError:
+                showerror("SNES NHL '94 Roster Tool", "Could not open ROM or snapshot file.  Please check file "
+                                                      "permissions.")
+            except ValueError:
+                showerror("SNES NHL '94 Roster Tool",
+                          "There was an error in accessing or modifying roster info.  Please make sure that "
+                          "you are using a valid NHL '94 ROM and roster snapshot.")
+
+    def importroster(self, file, rom):
+        # Import roster data from CSV into ROM
+        # Every team is encoded and checked before anything is written, so a failed import leaves the ROM untouched
+
+        status, rows = self.read_csv(file)
+        if status != 0:
+            return status
+
+        return self.import_rows(rows, rom)
+
+    def import_rows(self, rows, rom):
+        # Import a list of CSV rows into ROM
+
+        tmdata = {}
 
         # Retrieve Team Pointers and Info from ROM
-        tmarray = self.tm_ptrs(f)
+        tmarray = rom.tm_ptrs()
 
         # Generate Dictionary containing pointer, player space, and player data offset for each team
         for ptr in tmarray:
-            tminfo = self.get_team_info(f, ptr)
+            tminfo = rom.get_team_info(ptr)
             tmlist = [ptr, tminfo['plspace'], tminfo['ploff']]
             tmdata[tminfo['abv']] = tmlist
 
-        # Compare CSV Data Size to Player Data Size
-        # Each Player has a set amount of bytes, with only "Name" as variable.  Bytes = 10 + Player Name
+        # Group the rows for each team, and check and see if each team is in ROM
+        teams = self.partition_rows(rows)
+        for abv in teams:
+            if abv not in tmdata:
+                return 3
+
+        # Stage the changes for every team
+        staged = []
+        for abv, plrs in teams.items():
+            patch = self.encode_team(abv, plrs, tmdata[abv])
+            if patch is None:
+                return 4
+            staged.extend(patch)
 
-        curtm = ""
-        count = 0
-        numg = numf = numd = 0
-        tmspace = 0
-        tmptr = 0
+        # All teams are valid, write the changes
+        for pos, data in staged:
+            rom.write(pos, data)
 
-        for row in reader:
-            if row['Abv'] != curtm:
-                prevtm = curtm
-                curtm = row['Abv']
-                # Check and see if team is in ROM
-                if curtm in tmdata:
-                    if count != 0:  # Not the First Run, change Number of Players
-                        # Bug Fix - Add 02 00 to end of Roster List
-                        f.write(struct.pack("B", 2))
-                        f.write(struct.pack("B", 0))
-                        # Pad rest of Player data with FF
-                        for num in range(0, tmspace - 2):  # -2 to compensate for the 0200 above
-                            f.write(struct.pack("B", 255))
-
-                        # Prepare and write previous team's G, F and D
-                        if numg == 1:
-                            gb1 = 16
-                            gb2 = 0
-                        elif numg == 2:
-                            gb1 = 17
-                            gb2 = 0
-                        elif numg == 3:
-                            gb1 = 17
-                            gb2 = 16
-                        elif numg == 4:
-                            gb1 = 17
-                            gb2 = 17
-                        else:
-                            showerror("SNES '94 Roster Tool",
-                                      "The number of Goalies on " + prevtm + " must be between 1 and 4.")
-                            csvfile.close()
-                            return 4
-
-                        if numf < 1 or numf > 15:
-                            showerror("SNES '94 Roster Tool",
-                                      "The number of Forwards on " + prevtm + " must be between 1 and 15.")
-                            csvfile.close()
-                            return 4
-                        if numd < 1 or numd > 15:
-                            showerror("SNES '94 Roster Tool",
-                                      "The number of Defenders on " + prevtm + " must be between 1 and 15.")
-                            csvfile.close()
-                            return 4
-
-                        fwd = hex(numf)
-                        fwd = fwd[2:]
-                        dfs = hex(numd)
-                        dfs = dfs[2:]
-                        numfd = fwd + dfs
-
-                        # Update G, F and D
-
-                        f.seek(tmptr + 17)
-                        f.write(struct.pack("B", int(numfd, 16)))
-                        f.seek(tmptr + 19)
-                        f.write(struct.pack("2B", gb1, gb2))
-
-                        # Update Lines (First G, First 3 Fs, First 2 D)
-                        # BEST, SC1, SC2, CHK, PP1, PP2, PK1, PK2 - G, LD, RD, LW, C, RW, XA
-
-                        # Find Players for Default Line
-                        line = [hex(1)]  # G
-                        firstd = numg + numf + 1
-                        firstf = numg + 1
-                        line.append(hex(firstd))
-                        line.append(hex(firstd + 1))
-                        for fwd in range(firstf, firstf + 4):
-                            line.append(hex(fwd))
-
-                        f.seek(tmptr + 21)  # Move to BEST
-
-                        for i in range(1, 9):
-                            for plr in line:
-                                f.write(struct.pack("B", int(plr, 16)))
-                            f.write(struct.pack("B", 0))
-
-                        numg = numf = numd = 0
-
-                    count += 1
-                    tmptr = tmdata[curtm][0]
-                    tmspace = tmdata[curtm][1]
-                    tmspace = int(tmspace)
-                    f.seek(tmptr + tmdata[curtm][2])  # Move to Player Data
-                else:
-                    csvfile.close()
-                    return 3
+        return 0
 
-            # Process row from CSV
-            # Name passed to bytearray for conversion and writing in ASCII format.  All other values are converted to
-            # int base 16 before being written into file
+    def encode_team(self, abv, plrs, tmlist):
+        # Encode a team's players, G, F and D and Lines for the ROM
+        # Returns a list of (ROM offset, bytes) to be written, or None if the team cannot be imported
 
+        tmptr, tmspace, ploff = tmlist
+        tmspace = int(tmspace)
+        numg = numf = numd = 0
+        block = bytearray()
+
+        # Compare CSV Data Size to Player Data Size
+        # Each Player has a set amount of bytes, with only "Name" as variable.  Bytes = 10 + Player Name
+
+        for row in plrs:
             name = row['First'] + " " + row['Last']
             nmlength = len(name) + 2  # First Byte
 
@@ -363,9 +643,8 @@ class RosExt(Frame):
 
             if tmspace <= 10:
                 showerror("SNES '94 Roster Tool", "There is not enough player space to add " + name + " for team "
-                          + curtm + ".  You are " + str(abs(tmspace)) + " player bytes short.")
-                csvfile.close()
-                return 4
+                          + abv + ".  You are " + str(abs(tmspace)) + " player bytes short.")
+                return None
 
             tmspace -= nmlength + 8
 
@@ -377,125 +656,311 @@ class RosExt(Frame):
                 numd += 1
             else:
                 showerror("SNES '94 Roster Tool", "There is an unknown position designated for " + name + ".")
-                csvfile.close()
-                return 4
-
-            # Begin writing to file
-
-            f.write(struct.pack("B", nmlength))
-            f.write(struct.pack("B", 0))
-            player = bytearray(name, 'utf-8')
-            f.write(player)
-
-            jno = row['JNo']
-            f.write(struct.pack("B", int(jno, 16)))
-
-            # Change Weight and Handedness to Hex
-
-            wgt = hex(int(row['Wgt']))
-            wgt = wgt[2:]
-
-            hnd = hex(int(row['Hnd']))
-            hnd = hnd[2:]
-
-            # Create Attrib String
-
-            attstring = wgt + row['Agl'] + row['Spd'] + row['OfA'] + row['DfA'] + row['ShP-PkC'] + row['Chk']
-            attstring += hnd + row['StH'] + row['ShA'] + row['End-StR'] + row['Rgh-StL'] + row['Pas-GlR']
-            attstring += row['Agr-GlL']
-            attrib = [attstring[i:i + 2] for i in range(0, len(attstring), 2)]
-            for att in attrib:
-                f.write(struct.pack("B", int(att, 16)))
-
-        # Process the last team in CSV file
-        if count != 0:  # At least 1 team was processed
-            # Pad rest of Player data with FF
-            # Bug Fix - Add 02 00 to end of Roster List
-            f.write(struct.pack("B", 2))
-            f.write(struct.pack("B", 0))
-            for num in range(0, tmspace - 2):  # -2 to compensate for the 0200 above
-                f.write(struct.pack("B", 255))
-
-            # Prepare and write previous team's G, F and D
-            if numg == 1:
-                gb1 = 16
-                gb2 = 0
-            elif numg == 2:
-                gb1 = 17
-                gb2 = 0
-            elif numg == 3:
-                gb1 = 17
-                gb2 = 16
-            elif numg == 4:
-                gb1 = 17
-                gb2 = 17
-            else:
-                showerror("SNES '94 Roster Tool",
-                          "The number of Goalies on " + prevtm + " must be between 1 and 4.")
-                csvfile.close()
-                return 4
-
-            if numf < 1 or numf > 15:
-                showerror("SNES '94 Roster Tool",
-                          "The number of Forwards on " + prevtm + " must be between 1 and 15.")
-                csvfile.close()
-                return 4
-            if numd < 1 or numd > 15:
-                showerror("SNES '94 Roster Tool",
-                          "The number of Defenders on " + prevtm + " must be between 1 and 15.")
-                csvfile.close()
-                return 4
+                return None
+
+            block += self.encode_player(row)
+
+        # Bug Fix - Add 02 00 to end of Roster List
+        block += struct.pack("2B", 2, 0)
+        # Pad rest of Player data with FF
+        block += b'\xff' * (tmspace - 2)  # -2 to compensate for the 0200 above
+
+        # The last Player can still run past the Player Data Space and into the Team Name Data
+        if len(block) > int(tmlist[1]) + 2:
+            showerror("SNES '94 Roster Tool", "There is not enough player space for team " + abv + ".  You are "
+                      + str(len(block) - int(tmlist[1]) - 2) + " player bytes short.")
+            return None
+
+        # Prepare team's G, F and D
+        if numg == 1:
+            gb1 = 16
+            gb2 = 0
+        elif numg == 2:
+            gb1 = 17
+            gb2 = 0
+        elif numg == 3:
+            gb1 = 17
+            gb2 = 16
+        elif numg == 4:
+            gb1 = 17
+            gb2 = 17
+        else:
+            showerror("SNES '94 Roster Tool",
+                      "The number of Goalies on " + abv + " must be between 1 and 4.")
+            return None
+
+        if numf < 1 or numf > 15:
+            showerror("SNES '94 Roster Tool",
+                      "The number of Forwards on " + abv + " must be between 1 and 15.")
+            return None
+        if numd < 1 or numd > 15:
+            showerror("SNES '94 Roster Tool",
+                      "The number of Defenders on " + abv + " must be between 1 and 15.")
+            return None
+
+        # G nibbles are followed by the Lines (First G, First 3 Fs, First 2 D)
+        # BEST, SC1, SC2, CHK, PP1, PP2, PK1, PK2 - G, LD, RD, LW, C, RW, XA
+
+        lines = bytearray(struct.pack("2B", gb1, gb2))
+
+        # Find Players for Default Line
+        line = [1]  # G
+        firstd = numg + numf + 1
+        firstf = numg + 1
+        line.append(firstd)
+        line.append(firstd + 1)
+        for fwd in range(firstf, firstf + 4):
+            line.append(fwd)
+        line.append(0)
+
+        for i in range(1, 9):
+            lines += bytes(line)
+
+        return [(tmptr + ploff, bytes(block)), (tmptr + 17, struct.pack("B", numf * 16 + numd)),
+                (tmptr + 19, bytes(lines))]
+
+    def extractroster(self, rom, w):
+        # Extract roster data from ROM
 
-            fwd = hex(numf)
-            fwd = fwd[2:]
-            dfs = hex(numd)
-            dfs = dfs[2:]
-            numfd = fwd + dfs
+        fields = ['First', 'Last', 'Abv', 'Pos', 'JNo', 'Ovr', 'Wgt', 'Agl', 'Spd', 'OfA', 'DfA', 'ShP-PkC', 'Chk',
+                  'Hnd', 'StH', 'ShA', 'End-StR', 'Rgh-StL', 'Pas-GlR', 'Agr-GlL']
+        tminfo = {}
+        writer = csv.DictWriter(w, fieldnames=fields, delimiter=',')
+        writer.writeheader()
+        tmarray = rom.tm_ptrs()
 
-            # Update G, F and D
+        for ptr in tmarray:
+            tminfo = rom.get_team_info(ptr)
+            self.get_player_info(rom, ptr, tminfo, writer)
 
-            f.seek(tmptr + 17)
-            f.write(struct.pack("B", int(numfd, 16)))
-            f.seek(tmptr + 19)
-            f.write(struct.pack("2B", gb1, gb2))
+    def load_source(self, file):
+        # Load each team's Player Data from a ROM, CSV or snapshot file for comparison
+        # Returns a dictionary of team abv -> [hash, (G, F, D), player data], or None if the CSV is not valid
+        # CSV teams are encoded the same way as an import, so all kinds of file can be compared byte for byte
 
-            # Update Lines (First G, First 3 Fs, First 2 D)
-            # BEST, SC1, SC2, CHK, PP1, PP2, PK1, PK2 - G, LD, RD, LW, C, RW, XA
+        teams = {}
 
-            # Find Players for Default Line
-            line = [hex(1)]  # G
-            firstd = numg + numf + 1
-            firstf = numg + 1
-            line.append(hex(firstd))
-            line.append(hex(firstd + 1))
-            for fwd in range(firstf, firstf + 4):
-                line.append(hex(fwd))
+        if file.lower().endswith('.n94'):
+            for tm in self.load_snapshot(file):
+                teams[tm['abv']] = [tm['hash'], tm['counts'], tm['block']]
 
-            f.seek(tmptr + 21)  # Move to BEST
+        elif file.lower().endswith('.csv'):
+            status, rows = self.read_csv(file)
+            if status == 2:
+                showerror("SNES NHL '94 Roster Tool", "The CSV file " + file + " is missing fields or some fields "
+                                                      "are blank.  Please check the file.")
+            if status != 0:
+                return None
 
-            for i in range(1, 9):
-                for plr in line:
-                    f.write(struct.pack("B", int(plr, 16)))
-                f.write(struct.pack("B", 0))
+            for abv, plrs in self.partition_rows(rows).items():
+                counts = tuple(sum(1 for row in plrs if row['Pos'] == pos) for pos in ('G', 'F', 'D'))
+                if sum(counts) != len(plrs):
+                    raise ValueError("Unknown position on " + abv)
 
-        return 0
+                block = b''.join(self.encode_player(row) for row in plrs)
+                teams[abv] = [self.team_hash(counts, block), counts, block]
 
-    def extractroster(self, f, w):
-        # Extract roster data from ROM
+        else:
+            with open(file, 'rb') as f:
+                rom = RomData(f.read())
+            for tminfo, counts, block in rom.read_teams():
+                teams[tminfo['abv']] = [self.team_hash(counts, block), counts, block]
+
+        return teams
+
+    def team_hash(self, counts, block):
+        # Hash of a team's # of G, F and D and Player Data
+        return zlib.crc32(struct.pack("3B", *counts) + block)
+
+    def make_snapshot(self, rom):
+        # Create a Roster Snapshot from a ROM (see SNAP_HEAD for the format)
+
+        teams = rom.read_teams()
+        index = bytearray()
+        records = bytearray()
+        recoff = SNAP_HEAD.size + SNAP_TEAM.size * len(teams)
+
+        for tminfo, counts, block in teams:
+            index += SNAP_TEAM.pack(recoff + len(records), self.team_hash(counts, block), tminfo['plspace'],
+                                    tminfo['ploff'], len(block), *counts)
+            for key in ('city', 'abv', 'name'):
+                text = tminfo[key].encode("utf-8")
+                records += struct.pack("B", len(text)) + text
+            records += block
+
+        body = bytes(index + records)
+        head = SNAP_HEAD.pack(SNAP_MAGIC, SNAP_VERSION, len(teams), 0)[:SNAP_HEAD.size - 4]
+        return SNAP_HEAD.pack(SNAP_MAGIC, SNAP_VERSION, len(teams), zlib.crc32(body, zlib.crc32(head))) + body
+
+    def load_snapshot(self, file):
+        # Read a Roster Snapshot file and its teams
+
+        with open(file, 'rb') as s:
+            return self.read_snapshot(s.read())
+
+    def read_snapshot(self, data):
+        # Read the teams from a Roster Snapshot
+        # Only the Team Index and names are read, the Player Data is sliced out without decoding it
+        # Anything that does not fit in the file raises ValueError
+
+        if len(data) < SNAP_HEAD.size:
+            raise ValueError("Not a roster snapshot")
+
+        magic, version, numtm, crc = SNAP_HEAD.unpack_from(data, 0)
+        if magic != SNAP_MAGIC or version > SNAP_VERSION:
+            raise ValueError("Not a supported roster snapshot")
+        if zlib.crc32(data[SNAP_HEAD.size:], zlib.crc32(data[:SNAP_HEAD.size - 4])) != crc:
+            raise ValueError("Roster snapshot checksum does not match")
+        if SNAP_HEAD.size + numtm * SNAP_TEAM.size > len(data):
+            raise ValueError("Roster snapshot Team Index does not fit in the file")
+
+        teams = []
+        for i in range(0, numtm):
+            recoff, thash, plspace, ploff, size, numg, numf, numd = \
+                SNAP_TEAM.unpack_from(data, SNAP_HEAD.size + i * SNAP_TEAM.size)
+
+            names = []
+            for key in range(0, 3):
+                if recoff >= len(data):
+                    raise ValueError("Roster snapshot Team Record does not fit in the file")
+                nml = data[recoff]
+                names.append(data[recoff + 1:recoff + 1 + nml].decode("utf-8"))
+                recoff += 1 + nml
+
+            if recoff + size > len(data):
+                raise ValueError("Roster snapshot Team Record does not fit in the file")
+
+            teams.append(dict(city=names[0], abv=names[1], name=names[2], plspace=plspace, ploff=ploff, hash=thash,
+                              counts=(numg, numf, numd), block=data[recoff:recoff + size]))
+
+        return teams
+
+    def snapshot_rows(self, teams):
+        # Decode the players of every team in a Roster Snapshot into CSV rows
+
+        rows = []
+        for tm in teams:
+            for output in self.decode_players(tm['block'], tm['abv'], *tm['counts']):
+                rows.append({key: str(val) for key, val in output.items()})
+        return rows
+
+    def snapshot_to_csv(self, teams, w):
+        # Write the players of a Roster Snapshot to CSV
 
         fields = ['First', 'Last', 'Abv', 'Pos', 'JNo', 'Ovr', 'Wgt', 'Agl', 'Spd', 'OfA', 'DfA', 'ShP-PkC', 'Chk',
                   'Hnd', 'StH', 'ShA', 'End-StR', 'Rgh-StL', 'Pas-GlR', 'Agr-GlL']
-        tminfo = {}
         writer = csv.DictWriter(w, fieldnames=fields, delimiter=',')
         writer.writeheader()
-        tmarray = self.tm_ptrs(f)
-        print(tmarray)
-
-        for ptr in tmarray:
-            tminfo = self.get_team_info(f, ptr)
-            self.get_player_info(f, ptr, tminfo, writer)
-
-        showinfo("SNES NHL '94 Roster Tool", "Roster Data has been extracted.")
+        writer.writerows(self.snapshot_rows(teams))
+
+    def diff_rosters(self, old, new):
+        # Compare two sets of teams from load_source
+        # Teams with matching hashes are skipped, only changed teams have their players decoded
+        # Players are matched by name in roster order, so two players with the same name are kept apart
+
+        diff = dict(teams_added=[abv for abv in new if abv not in old],
+                    teams_removed=[abv for abv in old if abv not in new], unchanged=[], teams={}, moved=[])
+        added = []
+        removed = []
+
+        for abv in list(old) + diff['teams_added']:
+            if abv in old and abv in new and old[abv][0] == new[abv][0]:
+                diff['unchanged'].append(abv)
+                continue
+
+            oldp = self.decode_players(old[abv][2], abv, *old[abv][1]) if abv in old else []
+            newp = self.decode_players(new[abv][2], abv, *new[abv][1]) if abv in new else []
+
+            newnames = {}
+            for i, plr in enumerate(newp):
+                newnames.setdefault(self.player_name(plr), []).append(i)
+
+            tmdiff = dict(added=[], removed=[], changed=[], reordered=False)
+            matched = []
+            for plr in oldp:
+                name = self.player_name(plr)
+                if newnames.get(name):
+                    i = newnames[name].pop(0)
+                    matched.append(i)
+                    changes = self.diff_player(plr, newp[i])
+                    if changes:
+                        tmdiff['changed'].append({'name': name, 'changes': changes})
+                else:
+                    removed.append(plr)
+            for i, plr in enumerate(newp):
+                if i not in matched:
+                    added.append(plr)
+
+            # The Default Lines follow the roster order, so a change in order is reported too
+            tmdiff['reordered'] = matched != sorted(matched)
+            diff['teams'][abv] = tmdiff
+
+        # A player removed from one team and added to another has moved
+        for plr in removed:
+            name = self.player_name(plr)
+            newplr = next((new for new in added if self.player_name(new) == name and new['Abv'] != plr['Abv']),
+                          None)
+            if newplr is not None:
+                added.remove(newplr)
+                diff['moved'].append({'name': name, 'from': plr['Abv'], 'to': newplr['Abv'],
+                                      'changes': self.diff_player(plr, newplr)})
+            else:
+                diff['teams'][plr['Abv']]['removed'].append(name)
+        for plr in added:
+            diff['teams'][plr['Abv']]['added'].append(self.player_name(plr))
+
+        # Teams whose players decode the same (with no moves in or out) have not changed
+        movedtms = set(move['from'] for move in diff['moved']) | set(move['to'] for move in diff['moved'])
+        for abv, tmdiff in list(diff['teams'].items()):
+            if not any(tmdiff.values()) and abv not in movedtms:
+                del diff['teams'][abv]
+                diff['unchanged'].append(abv)
+
+        return diff
+
+    def player_name(self, plr):
+        return plr['First'] + " " + plr['Last']
+
+    def diff_player(self, old, new):
+        # Position, Jersey and Attribute changes for a player - Ovr is left out as it follows the attributes
+
+        return {key: [old[key], new[key]] for key in old if key not in ('First', 'Last', 'Abv', 'Ovr')
+                and old[key] != new[key]}
+
+    def format_diff(self, diff):
+        # Text version of the comparison report
+
+        lines = [str(len(diff['unchanged'])) + " team(s) unchanged, " + str(len(diff['teams'])) + " team(s) changed."]
+        if diff['teams_added']:
+            lines.append("Teams added: " + ', '.join(diff['teams_added']))
+        if diff['teams_removed']:
+            lines.append("Teams removed: " + ', '.join(diff['teams_removed']))
+
+        for abv, tmdiff in diff['teams'].items():
+            lines.append("")
+            lines.append(abv)
+            for name in tmdiff['added']:
+                lines.append("  + " + name)
+            for name in tmdiff['removed']:
+                lines.append("  - " + name)
+            for change in tmdiff['changed']:
+                lines.append("  * " + change['name'] + ": " + self.format_changes(change['changes']))
+            if tmdiff['reordered']:
+                lines.append("  ~ Roster order changed")
+
+        if diff['moved']:
+            lines.append("")
+            lines.append("Moved")
+            for move in diff['moved']:
+                line = "  " + move['name'] + ": " + move['from'] + " -> " + move['to']
+                if move['changes']:
+                    line += " (" + self.format_changes(move['changes']) + ")"
+                lines.append(line)
+
+        return '\n'.join(lines) + '\n'
+
+    def format_changes(self, changes):
+        return ', '.join(key + " " + str(val[0]) + " -> " + str(val[1]) for key, val in changes.items())
 
     def check_csv(self, reader):
         # Check CSV to make sure there are no missing fields for each entry
@@ -505,86 +970,96 @@ class RosExt(Frame):
                 return False
         return 1
 
-    def lit_to_big(self, little):
-        # Change byte string from little to big endian
-        return little[2:4] + little[0:2]
-
-    def tm_ptrs(self, f):
-        # Retrieve Team Offset Pointers
+    def read_csv(self, file):
+        # Read all rows from a roster CSV file
+        # Returns (0, rows) if successful, (2, None) for missing fields, (4, None) for incorrect column names
 
-        # Check for Header
-        self.checkhead(f)
+        fields = ['First', 'Last', 'Abv', 'Pos', 'JNo', 'Ovr', 'Wgt', 'Agl', 'Spd', 'OfA', 'DfA', 'ShP-PkC', 'Chk',
+                  'Hnd', 'StH', 'ShA', 'End-StR', 'Rgh-StL', 'Pas-GlR', 'Agr-GlL']
 
-        # Team Offset Start Position - 927207 - Headerless, 927719 Headered
-        f.seek(927207 + self.head_offset)
+        with open(file, 'r', newline='') as csvfile:
 
-        ptrarray = []
+            # Check for Header Rows
 
-        for i in range(0, 28):
-            firsttm = b2a_hex(f.read(2))
-            f.seek(2, 1)
+            header = csv.Sniffer().has_header(csvfile.read(1024))
+            csvfile.seek(0)
 
-            conv = self.lit_to_big(firsttm)
+            if header:
+                reader = csv.DictReader(csvfile)
+                chk = set(fields) & set(reader.fieldnames)
+                if len(chk) != 20:
+                    showerror("SNES '94 Roster Tool",
+                              "The column field names are incorrect.  They should be: " + ', '.join(fields))
+                    return 4, None
 
-            # If needed, add header offset
-            if self.head_offset == 512:
-                data = int(conv, 16) + int('0x0D8200', 16)
             else:
-                data = int(conv, 16) + int('0x0D8000', 16)
+                reader = csv.DictReader(csvfile, fieldnames=fields)
 
-            print(data)
-            ptrarray.append(data)
+            rows = list(reader)
 
-        return ptrarray
+        if not self.check_csv(rows):
+            return 2, None
 
-    def get_team_info(self, f, ptr):
-        # Retrieve Team Info
+        return 0, rows
 
-        # Team Name Data starts at the end of Player Data (offset given at bytes 4 and 5 in Team Data)
-        # First offset: Length of Team City (including this byte)
-        # AA 00 TEAM CITY BB 00 TEAM ABV CC 00 TEAM NICKNAME DD 00 TEAM ARENA
-        # AA - Length of Team City (includes AA and 00)
-        # BB - Length of Team Abv (includes BB and 00)
-        # CC - Length of Team Nickname (includes CC and 00)
-        # DD - Length of Team Arena (includes DD and 00)
-        # All Name Data is in ASCII format.
+    def partition_rows(self, rows):
+        # Split CSV rows by team in a single pass, so the CSV can be sorted in any order
+        # Each team's players are put in ROM order (Goalies, then F and D), keeping the CSV order within a position
+        # Rows with an unknown position go last so that they are still reported on import
 
-        # Player Data Offset - Default is 55 00 (85 bytes), but in some custom ROMs, may be different
-        f.seek(ptr)
-        plpos = self.lit_to_big(b2a_hex(f.read(2)))
-        ploff = int(plpos, 16)
+        order = {'G': 0, 'F': 1, 'D': 2}
+        teams = {}
 
-        # Team Data Offset - Team Offset + 4 bytes
-        f.seek(ptr + 4)
-        tmpos = self.lit_to_big(b2a_hex(f.read(2)))
-        dataoff = ptr + int(tmpos, 16)
+        for row in rows:
+            if row['Abv'] not in teams:
+                teams[row['Abv']] = [[], [], [], []]
+            teams[row['Abv']][order.get(row['Pos'], 3)].append(row)
 
-        # Calculate Player Data Space
-        # Team Data Offset - Player Data Offset - 2 (last 2 bytes of Player Data 02 00)
-        plsize = int(tmpos, 16) - ploff - 2
+        return {abv: g + fwd + dfs + other for abv, (g, fwd, dfs, other) in teams.items()}
+
+    def encode_player(self, row):
+        # Convert a CSV row into the ROM's Player Data format
+        # Name passed to bytearray for conversion and writing in ASCII format.  All other values are converted to
+        # int base 16 before being written into file
+
+        name = row['First'] + " " + row['Last']
+        nmlength = len(name) + 2  # First Byte
 
-        # Read Team City
-        f.seek(dataoff)
-        tml = int(self.lit_to_big(b2a_hex(f.read(1))), 16)
-        # Skip 00
-        f.seek(1, 1)
-        tmcity = f.read(tml - 2).decode("utf-8")
+        player = bytearray(struct.pack("2B", nmlength, 0))
+        player += bytearray(name, 'utf-8')
+        player += struct.pack("B", int(row['JNo'], 16))
 
-        # Read Team Abv
-        tml = int(self.lit_to_big(b2a_hex(f.read(1))), 16)
-        f.seek(1, 1)
-        tmabv = f.read(tml - 2).decode("utf-8")
+        # Change Weight and Handedness to Hex
 
-        # Read Team Nickname
-        tml = int(self.lit_to_big(b2a_hex(f.read(1))), 16)
-        f.seek(1, 1)
-        tmnm = f.read(tml - 2).decode("utf-8")
+        wgt = hex(int(row['Wgt']))
+        wgt = wgt[2:]
 
-        return dict(city=tmcity, abv=tmabv, name=tmnm, plspace=plsize, ploff=ploff)
+        hnd = hex(int(row['Hnd']))
+        hnd = hnd[2:]
 
-    def get_player_info(self, f, ptr, tminfo, writer):
+        # Create Attrib String
+
+        attstring = wgt + row['Agl'] + row['Spd'] + row['OfA'] + row['DfA'] + row['ShP-PkC'] + row['Chk']
+        attstring += hnd + row['StH'] + row['ShA'] + row['End-StR'] + row['Rgh-StL'] + row['Pas-GlR']
+        attstring += row['Agr-GlL']
+        attrib = [attstring[i:i + 2] for i in range(0, len(attstring), 2)]
+        for att in attrib:
+            player += struct.pack("B", int(att, 16))
+
+        return bytes(player)
+
+    def get_player_info(self, rom, ptr, tminfo, writer):
         # Retreive Player Info
 
+        numg, numf, numd = rom.get_counts(ptr)
+        block = rom.get_team_block(ptr, tminfo)
+
+        for output in self.decode_players(block, tminfo['abv'], numg, numf, numd):
+            writer.writerow(output)
+
+    def decode_players(self, block, abv, numg, numf, numd):
+        # Decode a team's Player Data into CSV rows
+
         # Player Data Starts 85 bytes (0x55) from Start offset (may be different in custom ROM)
 
         # XX 00 "PLAYER NAME" XX 123456789ABCDE
@@ -617,28 +1092,14 @@ class RosExt(Frame):
         # D = Passing/GlR
         # E = Aggression/GlL
 
-        # Calculate # of Players - Goalies First, then F and D
+        players = []
+        pos_in_block = 0
 
-        f.seek(ptr + 19)
-        gdata = b2a_hex(f.read(2)).decode("utf-8")
-        numg = gdata.find("0")
-        f.seek(ptr + 17)
-
-        pdata = b2a_hex(f.read(1))
-        numf = int(pdata[0:1], 16)
-        numd = int(pdata[1:2], 16)
-
-        nump = numg + numf + numd
-
-        # Move to Player Data
-
-        f.seek(ptr + tminfo['ploff'])
-        for i in range(1, nump + 1):
+        for i in range(1, numg + numf + numd + 1):
             # Name and JNo
-            pnl = int(b2a_hex(f.read(1)), 16)
-            f.seek(1, 1)
-            name = f.read(pnl - 2).decode("utf-8")
-            jno = b2a_hex(f.read(1)).decode("utf-8")
+            pnl = block[pos_in_block]
+            name = block[pos_in_block + 2:pos_in_block + pnl].decode("utf-8")
+            jno = b2a_hex(block[pos_in_block + pnl:pos_in_block + pnl + 1]).decode("utf-8")
             names = name.split(" ")
 
             # G, F or D?
@@ -653,73 +1114,80 @@ class RosExt(Frame):
             # Get Attributes
 
             attrib = []
-            adata = b2a_hex(f.read(7)).decode("utf-8")
+            adata = b2a_hex(block[pos_in_block + pnl + 1:pos_in_block + pnl + 8]).decode("utf-8")
             for ch in adata:
                 stat = int(ch, 16)
                 attrib.append(stat)
 
-            # Calculate Overall Ratings
+            pos_in_block += pnl + 8
 
-            # PLAYER:
-            # total = (agility * 2) + (speed * 3) + (offensive * 3) + (defensive * 2) + (shot_power * 1)
-            # + (checking * 2) + (stick_handling_value * 3) + (shot_accuracy * 2) + (endurance * 1) + (pass * 1)
+            ovr = self.calc_ovr(pos, attrib)
 
-            # if total < 50
-            #    x = 25 + total / 2
-            # else
-            #    x = total
+            output = {"First": names[0], "Last": names[1], "Abv": abv, "Pos": pos, "JNo": jno, "Ovr": ovr,
+                      "Wgt": attrib[0],
+                      "Agl": attrib[1], "Spd": attrib[2], "OfA": attrib[3], "DfA": attrib[4], "ShP-PkC": attrib[5],
+                      "Chk": attrib[6], "Hnd": attrib[7], "StH": attrib[8], "ShA": attrib[9], "End-StR": attrib[10],
+                      "Rgh-StL": attrib[11], "Pas-GlR": attrib[12], "Agr-GlL": attrib[13]}
+            players.append(output)
 
-            # x = round_down(x)
+        return players
 
-            # if x > 99
-            # overall_player = 99
-            # else
-            # overall_player = x
+    def calc_ovr(self, pos, attrib):
+        # Calculate Overall Ratings
 
-            # GOALIE:
+        # PLAYER:
+        # total = (agility * 2) + (speed * 3) + (offensive * 3) + (defensive * 2) + (shot_power * 1)
+        # + (checking * 2) + (stick_handling_value * 3) + (shot_accuracy * 2) + (endurance * 1) + (pass * 1)
 
-            # total = round_down(agility * 4.5) + round_down(defensive * 4.5) + round_down(puck_ctl * 4.5)
-            # + (stick_r * 1) + (stick_l * 1) + (glove_r * 1) + (glove_l * 1)
+        # if total < 50
+        #    x = 25 + total / 2
+        # else
+        #    x = total
 
-            # if total < 50
-            # x = 25 + total / 2
-            # else
-            # x = total
+        # x = round_down(x)
 
-            # x = rounddown(x)
+        # if x > 99
+        # overall_player = 99
+        # else
+        # overall_player = x
 
-            # if x > 99
-            # overall_goalie = 99
-            # else
-            # overall_goalie = x
+        # GOALIE:
 
-            if pos == 'G':
-                total = int(attrib[1] * 4.5) + int(attrib[4] * 4.5) + int(attrib[5] * 4.5) + attrib[10] + attrib[11] \
-                        + attrib[12] + attrib[13]
-                if total < 50:
-                    ovr = int(25 + (total / 2))
-                else:
-                    ovr = total
+        # total = round_down(agility * 4.5) + round_down(defensive * 4.5) + round_down(puck_ctl * 4.5)
+        # + (stick_r * 1) + (stick_l * 1) + (glove_r * 1) + (glove_l * 1)
+
+        # if total < 50
+        # x = 25 + total / 2
+        # else
+        # x = total
 
+        # x = rounddown(x)
+
+        # if x > 99
+        # overall_goalie = 99
+        # else
+        # overall_goalie = x
+
+        if pos == 'G':
+            total = int(attrib[1] * 4.5) + int(attrib[4] * 4.5) + int(attrib[5] * 4.5) + attrib[10] + attrib[11] \
+                    + attrib[12] + attrib[13]
+            if total < 50:
+                ovr = int(25 + (total / 2))
             else:
-                total = (attrib[1] * 2) + (attrib[2] * 3) + (attrib[3] * 3) + (attrib[4] * 2) + attrib[5] + \
-                        (attrib[6] * 2) + (attrib[8] * 3) + (attrib[9] * 2) + attrib[10] + attrib[12]
-                if total < 50:
-                    ovr = int(25 + (total / 2))
-                else:
-                    ovr = total
+                ovr = total
 
-            if ovr > 99:
-                ovr = 99
+        else:
+            total = (attrib[1] * 2) + (attrib[2] * 3) + (attrib[3] * 3) + (attrib[4] * 2) + attrib[5] + \
+                    (attrib[6] * 2) + (attrib[8] * 3) + (attrib[9] * 2) + attrib[10] + attrib[12]
+            if total < 50:
+                ovr = int(25 + (total / 2))
+            else:
+                ovr = total
 
-            # Print
+        if ovr > 99:
+            ovr = 99
 
-            output = {"First": names[0], "Last": names[1], "Abv": tminfo['abv'], "Pos": pos, "JNo": jno, "Ovr": ovr,
-                      "Wgt": attrib[0],
-                      "Agl": attrib[1], "Spd": attrib[2], "OfA": attrib[3], "DfA": attrib[4], "ShP-PkC": attrib[5],
-                      "Chk": attrib[6], "Hnd": attrib[7], "StH": attrib[8], "ShA": attrib[9], "End-StR": attrib[10],
-                      "Rgh-StL": attrib[11], "Pas-GlR": attrib[12], "Agr-GlL": attrib[13]}
-            writer.writerow(output)
+        return ovr
 
 
 def main():